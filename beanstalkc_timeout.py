@@ -20,10 +20,10 @@ limitations under the License.
 
 __version__ = '0.2.0'
 import errno
-import select
+import os
 import socket
-
-import yaml
+import struct
+import time
 
 
 DEFAULT_HOST = 'localhost'
@@ -32,6 +32,48 @@ DEFAULT_PRIORITY = 2**31
 DEFAULT_TTR = 120
 DEFAULT_TIMEOUT = socket.getdefaulttimeout() or 2
 DEFAULT_SO_KEEPALIVE = False
+DEFAULT_TCP_NODELAY = True
+RECV_SIZE = 4096
+BUFFER_SIZE = 65536
+
+# Command templates, shared by Connection and Pipeline
+_PUT = b'put %d %d %d %d\r\n'
+# put with the default priority, delay and ttr already filled in
+_PUT_DEFAULTS = b'put %d 0 %d %%d\r\n' % (DEFAULT_PRIORITY, DEFAULT_TTR)
+_RESERVE_WITH_TIMEOUT = b'reserve-with-timeout %d\r\n'
+_KICK = b'kick %d\r\n'
+_PEEK = b'peek %d\r\n'
+_USE = b'use %s\r\n'
+_WATCH = b'watch %s\r\n'
+_IGNORE = b'ignore %s\r\n'
+_STATS_TUBE = b'stats-tube %s\r\n'
+_PAUSE_TUBE = b'pause-tube %s %d\r\n'
+_DELETE = b'delete %d\r\n'
+_RELEASE = b'release %d %d %d\r\n'
+_BURY = b'bury %d %d\r\n'
+_TOUCH = b'touch %d\r\n'
+_STATS_JOB = b'stats-job %d\r\n'
+
+# Expected responses, as sets for constant-time status lookups
+_FOUND = frozenset([b'FOUND'])
+_NOT_FOUND = frozenset([b'NOT_FOUND'])
+_INSERTED = frozenset([b'INSERTED', b'BURIED'])
+_JOB_TOO_BIG = frozenset([b'JOB_TOO_BIG'])
+_RESERVED = frozenset([b'RESERVED'])
+_RESERVE_FAILED = frozenset([b'DEADLINE_SOON', b'TIMED_OUT'])
+_KICKED = frozenset([b'KICKED'])
+_OK = frozenset([b'OK'])
+_USING = frozenset([b'USING'])
+_WATCHING = frozenset([b'WATCHING'])
+_NOT_IGNORED = frozenset([b'NOT_IGNORED'])
+_PAUSED = frozenset([b'PAUSED'])
+_DELETED = frozenset([b'DELETED'])
+_RELEASED = frozenset([b'RELEASED', b'BURIED'])
+_BURIED = frozenset([b'BURIED'])
+_TOUCHED = frozenset([b'TOUCHED'])
+
+# errnos a blocking socket reports when SO_RCVTIMEO/SO_SNDTIMEO expire
+_TIMEOUT_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK)
 
 
 class Beanstalkc2Exception(Exception): pass
@@ -42,101 +84,253 @@ class UnexpectedResponse(Beanstalkc2Exception): pass
 class DeadlineSoon(Exception): pass
 
 
+def _kernel_timeouts(sock):
+    """Whether timeouts on sock can be left to SO_RCVTIMEO/SO_SNDTIMEO.
+
+    Only true for a plain stdlib socket on POSIX: green sockets (gevent,
+    eventlet) keep the fd non-blocking and wait in their hub, and Windows
+    takes these options in milliseconds, so both use socket timeouts."""
+    return os.name == 'posix' and type(sock).__module__ == 'socket'
+
+
+def _timeval(timeout):
+    """Pack a timeout in seconds as a struct timeval; None never expires."""
+    if timeout is None:
+        return struct.pack('ll', 0, 0)
+    seconds = int(timeout)
+    # An all-zero timeval means "no timeout", so round tiny values up
+    microseconds = max(int((timeout - seconds) * 1000000), int(not seconds))
+    return struct.pack('ll', seconds, microseconds)
+
+
+def _parse_yaml_list(body):
+    """Parse the YAML list of names beanstalkd sends for list-tubes."""
+    return [line[2:] for line in body.splitlines() if line.startswith('- ')]
+
+
+def _parse_yaml_dict(body):
+    """Parse the flat YAML mapping beanstalkd sends for the stats commands."""
+    stats = {}
+    for line in body.splitlines():
+        key, sep, value = line.partition(': ')
+        if sep:
+            stats[key] = _parse_yaml_scalar(value)
+    return stats
+
+
+def _parse_yaml_scalar(value):
+    if value.isdigit():
+        return int(value)
+    if value.replace('.', '', 1).isdigit():
+        return float(value)
+    if value in ('true', 'false'):
+        return value == 'true'
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def _put_header(size, priority, delay, ttr):
+    if priority == DEFAULT_PRIORITY and delay == 0 and ttr == DEFAULT_TTR:
+        return _PUT_DEFAULTS % size
+    return _PUT % (priority, delay, ttr, size)
+
+
+def _to_bytes(name):
+    """Encode a tube name given as text; beanstalkd names are ASCII."""
+    if isinstance(name, bytes):
+        return name
+    return name.encode('ascii')
+
+
+def _to_native(value):
+    """Decode bytes from the server to str on Python 3, for the tube names
+    and YAML documents handed back to callers; a no-op on Python 2."""
+    if isinstance(value, str):
+        return value
+    return value.decode('utf-8')
+
+
 class Connection(object):
     def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT,
-                 timeout=DEFAULT_TIMEOUT, keepalives=DEFAULT_SO_KEEPALIVE):
+                 timeout=DEFAULT_TIMEOUT, keepalives=DEFAULT_SO_KEEPALIVE,
+                 nodelay=DEFAULT_TCP_NODELAY, parse_yaml=True):
         self.host = host
         self.port = port
         self.timeout = timeout
         self.keepalives = keepalives
-        self.buf = bytearray()
+        self.nodelay = nodelay
+        self.parse_yaml = parse_yaml
+        self.buf = bytearray(BUFFER_SIZE)
         self.connect()
 
     def connect(self):
         """Connect to beanstalkd server."""
+        # Nothing read from or owed by a previous socket carries over
+        self._buf_pos = 0  # start of unread data
+        self._write_pos = 0  # end of unread data
+        self._lookahead = False  # reserve_iter's reserve awaits its response
+        self._prefetched = None  # job reserved ahead of time by reserve_iter
         self._socket = socket.create_connection(
                 (self.host, self.port), self.timeout)
-        self._socket.setblocking(0)
+        self._kernel_timeouts = _kernel_timeouts(self._socket)
+        if self._kernel_timeouts:
+            # Block in send/recv and let the kernel enforce timeouts, rather
+            # than polling the socket before every call.
+            self._socket.settimeout(None)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO,
+                                    _timeval(self.timeout))
+            self._timeout = None
+        else:
+            self._timeout = self.timeout
+        self._set_timeout(self.timeout)
         if self.keepalives:
             self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        self._select_socket = [self._socket.fileno()]
+        if self.nodelay:
+            # Commands are written whole; don't let Nagle hold them back
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     def close(self):
         """Close connection to server."""
         try:
-            self._sendall('quit\r\n')
+            self._sendall(b'quit\r\n')
             self._socket.close()
         except socket.error:
             pass
 
+    def _set_timeout(self, timeout):
+        """Set the timeout for the next receive; without kernel timeouts this
+        is the socket timeout, so it applies to sends as well."""
+        if timeout != self._timeout:
+            if self._kernel_timeouts:
+                self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO,
+                                        _timeval(timeout))
+            else:
+                self._socket.settimeout(timeout)
+            self._timeout = timeout
+
+    def _recv_into(self, timeout):
+        """Receive into the free tail of the buffer."""
+        self._set_timeout(timeout)
+        try:
+            received = self._socket.recv_into(
+                    memoryview(self.buf)[self._write_pos:])
+        except socket.error as e:
+            if e.errno in _TIMEOUT_ERRNOS:
+                raise socket.timeout('timed out')
+            raise
+        if not received:
+            raise ConnectionClosed(
+                    '%s:%s connection closed' % (self.host, self.port))
+        self._write_pos += received
+
     def _sendall(self, data):
+        if not self._kernel_timeouts:
+            self._set_timeout(self.timeout)
         try:
-            sent = self._socket.send(data)
+            self._socket.sendall(data)
         except socket.error as e:
-            if e.errno == errno.EAGAIN:
-                # EAGAIN means we just need to select and try again
-                sent = 0
-            else:
-                raise
-        remaining = len(data) - sent
-        while remaining:
-            _, w, _ = select.select([], self._select_socket, [], self.timeout)
-            if not w:
+            if e.errno in _TIMEOUT_ERRNOS:
                 raise socket.timeout('timed out')
-            try:
-                sent += self._socket.send(data[sent:])
-            except socket.error as e:
-                # EAGAINs are safe to ignore
-                if e.errno != errno.EAGAIN:
-                    raise
-            else:
-                remaining -= sent
+            raise
+
+    def _sendmsg_all(self, buffers):
+        """Send several buffers without first joining them into one string,
+        using scatter/gather writes where the socket supports them."""
+        if not hasattr(self._socket, 'sendmsg'):
+            self._sendall(b''.join(buffers))
+            return
+        if not self._kernel_timeouts:
+            self._set_timeout(self.timeout)
+        buffers = list(buffers)
+        try:
+            while buffers:
+                sent = self._socket.sendmsg(buffers)
+                while buffers and sent >= len(buffers[0]):
+                    sent -= len(buffers.pop(0))
+                if sent:
+                    # Partial write, resume within the first unsent buffer
+                    buffers[0] = memoryview(buffers[0])[sent:]
+        except socket.error as e:
+            if e.errno in _TIMEOUT_ERRNOS:
+                raise socket.timeout('timed out')
+            raise
 
-    def _interact(self, command, expected_ok, expected_err=(), timeout=None):
+    def _interact(self, command, expected_ok, expected_err=(), timeout=None,
+                  body=None):
         if timeout is None:
             timeout = self.timeout
-        self._sendall(command)
+        self._finish_lookahead()
+        if body is None:
+            self._sendall(command)
+        else:
+            self._sendmsg_all([command, body, b'\r\n'])
         status, results = self._read_response(timeout)
+        return self._check_response(
+                command, status, results, expected_ok, expected_err)
+
+    def _check_response(self, command, status, results, expected_ok,
+                        expected_err):
         if status in expected_ok:
             return results
-        elif status in expected_err:
-            raise CommandFailed(command.split()[0], status, results)
+        # Only split off the command name; a put command includes the body
+        name = command.split(None, 1)[0]
+        if status in expected_err:
+            raise CommandFailed(name, status, results)
         else:
-            raise UnexpectedResponse(command.split()[0], status, results)
+            raise UnexpectedResponse(name, status, results)
 
     def _read_response(self, timeout):
+        buf = self.buf  # only ever resized in place
+        scanned = 0  # unread bytes already searched for the line end
         while 1:
-            r, _, _ = select.select(self._select_socket, [], [], timeout)
-            if not r:
-                raise socket.timeout('timed out')
-            chunk = self._socket.recv(256)
-            if not chunk:
-                raise ConnectionClosed(
-                        '%s:%s connection closed' % (self.host, self.port))
-            self.buf.extend(chunk)
-            line, _, self.buf = self.buf.partition('\r\n')
-            if line:
-                # Line received, return
-                response = line.split()
-                return response[0], response[1:]
+            start = self._buf_pos
+            if self._write_pos - start > scanned:
+                end = buf.find(b'\r\n', start + scanned, self._write_pos)
+                if end >= 0:
+                    # Line buffered, return without touching the socket
+                    response = memoryview(buf)[start:end].tobytes().split()
+                    self._advance(end + 2)
+                    return response[0], response[1:]
+                # Keep the last byte in the search, it may be a lone '\r'
+                scanned = max(self._write_pos - start - 1, 0)
+            self._reserve(RECV_SIZE)
+            self._recv_into(timeout)
 
     def _read_body(self, size):
         full_size = size + 2  # trailing "\r\n"
-        remaining = full_size - len(self.buf)
-        while remaining > 0:
-            r, _, _ = select.select(self._select_socket, [], [], self.timeout)
-            if not r:
-                raise socket.timeout('timed out')
-            chunk = self._socket.recv(remaining)
-            if not chunk:
-                raise ConnectionClosed(
-                        '%s:%s connection closed' % (self.host, self.port))
-            self.buf.extend(chunk)
-            remaining = full_size - len(self.buf)
-        body = str(self.buf[:size])
-        self.buf = self.buf[full_size:]
+        missing = full_size - (self._write_pos - self._buf_pos)
+        if missing > 0:
+            self._reserve(missing)
+            while self._write_pos - self._buf_pos < full_size:
+                self._recv_into(self.timeout)
+        start = self._buf_pos
+        body = memoryview(self.buf)[start:start + size].tobytes()
+        self._advance(start + full_size)
         return body
 
+    def _reserve(self, size):
+        """Make room for at least size more bytes after the unread data,
+        moving it to the front of the buffer and growing it as needed."""
+        if len(self.buf) - self._write_pos >= size:
+            return
+        unread = self._write_pos - self._buf_pos
+        self.buf[:unread] = self.buf[self._buf_pos:self._write_pos]
+        self._buf_pos, self._write_pos = 0, unread
+        shortfall = size - (len(self.buf) - unread)
+        if shortfall > 0:
+            self.buf.extend(bytearray(shortfall))
+
+    def _advance(self, pos):
+        """Consume the buffer up to pos."""
+        if pos == self._write_pos:
+            self._buf_pos = self._write_pos = 0
+            if len(self.buf) > BUFFER_SIZE:
+                # Don't hold on to the room a large body needed
+                del self.buf[BUFFER_SIZE:]
+        else:
+            self._buf_pos = pos
+
     def _interact_value(self, command, expected_ok, expected_err=()):
         return self._interact(command, expected_ok, expected_err)[0]
 
@@ -147,144 +341,335 @@ class Connection(object):
         body = self._read_body(int(size))
         return Job(self, int(jid), body, reserved)
 
-    def _interact_yaml(self, command, expected_ok, expected_err=()):
+    def _interact_yaml(self, command, expected_ok, expected_err=(),
+                       parse=_parse_yaml_dict):
         size, = self._interact(command, expected_ok, expected_err)
-        body = self._read_body(int(size))
-        return yaml.load(body)
+        body = _to_native(self._read_body(int(size)))
+        if self.parse_yaml is True:
+            return parse(body)
+        elif self.parse_yaml:
+            return self.parse_yaml(body)
+        return body
 
     def _interact_peek(self, command):
         try:
-            return self._interact_job(command, ['FOUND'], ['NOT_FOUND'], False)
-        except CommandFailed, (_, status, results):
+            return self._interact_job(command, _FOUND, _NOT_FOUND,
+                                      False)
+        except CommandFailed:
             return None
 
+    def _finish_lookahead(self):
+        """Read the response to reserve_iter's look-ahead reserve, if one is
+        outstanding, so the connection is free for the next command."""
+        if not self._lookahead:
+            return
+        self._lookahead = False
+        try:
+            self._prefetched = self._read_reserved(_RESERVE_WITH_TIMEOUT % 0,
+                                                   self.timeout)
+        except DeadlineSoon:
+            pass
+
+    def _take_lookahead(self):
+        self._finish_lookahead()
+        job, self._prefetched = self._prefetched, None
+        return job
+
+    def _reserve_command(self, timeout):
+        """Return the reserve command for timeout and how long the socket
+        should wait for its response."""
+        if timeout is not None:
+            return _RESERVE_WITH_TIMEOUT % timeout, timeout + self.timeout
+        return b'reserve\r\n', self.timeout
+
+    def _read_reserved(self, command, timeout):
+        status, results = self._read_response(timeout)
+        try:
+            jid, size = self._check_response(
+                    command, status, results, _RESERVED, _RESERVE_FAILED)
+        except CommandFailed as e:
+            _, status, results = e.args
+            if status == b'TIMED_OUT':
+                return None
+            elif status == b'DEADLINE_SOON':
+                raise DeadlineSoon(results)
+        return Job(self, int(jid), self._read_body(int(size)))
+
     # -- public interface --
 
     def put(self, body, priority=DEFAULT_PRIORITY, delay=0, ttr=DEFAULT_TTR):
         """Put a job into the current tube. Returns job id."""
-        assert isinstance(body, str), 'Job body must be a str instance'
-        jid = self._interact_value(
-                'put %d %d %d %d\r\n%s\r\n' %
-                    (priority, delay, ttr, len(body), body),
-                ['INSERTED', 'BURIED'], ['JOB_TOO_BIG'])
+        assert isinstance(body, bytes), 'Job body must be a bytes instance'
+        # The body is sent as is, after the header, never copied into it
+        header = _put_header(len(body), priority, delay, ttr)
+        jid, = self._interact(header, _INSERTED, _JOB_TOO_BIG, body=body)
         return int(jid)
 
+    def pipeline(self):
+        """Return a Pipeline, which batches commands into a single write and
+        a single pass over their responses."""
+        return Pipeline(self)
+
     def reserve(self, timeout=None):
         """Reserve a job from one of the watched tubes, with optional timeout
         in seconds. Returns a Job object, or None if the request times out."""
-        if timeout is not None:
-            command = 'reserve-with-timeout %d\r\n' % timeout
-            socket_timeout = timeout + self.timeout
-        else:
-            command = 'reserve\r\n'
-            socket_timeout = timeout
+        command, socket_timeout = self._reserve_command(timeout)
+        self._finish_lookahead()
+        self._sendall(command)
+        return self._read_reserved(command, socket_timeout)
+
+    def reserve_iter(self, timeout=None):
+        """Generate reserved jobs, like calling reserve(timeout) until it
+        returns None.
+
+        Before a job is handed out, a non-blocking reserve for the next one is
+        sent, so its round trip overlaps with the work done on the current
+        job. This keeps up to one extra job reserved, and its time-to-run
+        starts counting when it is reserved, not when it is handed out. So
+        if it was reserved a while ago, it is touched first to renew its
+        time-to-run, and dropped if its reservation has already expired
+        (another worker may have it by then). If the generator is closed
+        early, the extra job is released again."""
+        reserved_at = 0
         try:
-            return self._interact_job(command,
-                                      ['RESERVED'],
-                                      ['DEADLINE_SOON', 'TIMED_OUT'],
-                                      timeout=socket_timeout)
-        except CommandFailed, (_, status, results):
-            if status == 'TIMED_OUT':
-                return None
-            elif status == 'DEADLINE_SOON':
-                raise DeadlineSoon(results)
+            while 1:
+                job = self._take_lookahead()
+                # beanstalkd's shortest time-to-run is one second
+                if job is not None and time.time() - reserved_at >= 1:
+                    try:
+                        self.touch(job.jid)
+                    except CommandFailed:
+                        job = None
+                if job is None:
+                    job = self.reserve(timeout)
+                    if job is None:
+                        return
+                reserved_at = time.time()
+                self._sendall(_RESERVE_WITH_TIMEOUT % 0)
+                self._lookahead = True
+                yield job
+        finally:
+            job = self._take_lookahead()
+            if job is not None:
+                job.release()
 
     def kick(self, bound=1):
         """Kick at most bound jobs into the ready queue."""
-        return int(self._interact_value('kick %d\r\n' % bound, ['KICKED']))
+        return int(self._interact_value(_KICK % bound, _KICKED))
 
     def peek(self, jid):
         """Peek at a job. Returns a Job, or None."""
-        return self._interact_peek('peek %d\r\n' % jid)
+        return self._interact_peek(_PEEK % jid)
 
     def peek_ready(self):
         """Peek at next ready job. Returns a Job, or None."""
-        return self._interact_peek('peek-ready\r\n')
+        return self._interact_peek(b'peek-ready\r\n')
 
     def peek_delayed(self):
         """Peek at next delayed job. Returns a Job, or None."""
-        return self._interact_peek('peek-delayed\r\n')
+        return self._interact_peek(b'peek-delayed\r\n')
 
     def peek_buried(self):
         """Peek at next buried job. Returns a Job, or None."""
-        return self._interact_peek('peek-buried\r\n')
+        return self._interact_peek(b'peek-buried\r\n')
 
     def tubes(self):
         """Return a list of all existing tubes."""
-        return self._interact_yaml('list-tubes\r\n', ['OK'])
+        return self._interact_yaml(b'list-tubes\r\n', _OK,
+                                   parse=_parse_yaml_list)
 
     def using(self):
         """Return a list of all tubes currently being used."""
-        return self._interact_value('list-tube-used\r\n', ['USING'])
+        return _to_native(
+                self._interact_value(b'list-tube-used\r\n', _USING))
 
     def use(self, name):
         """Use a given tube."""
-        return self._interact_value('use %s\r\n' % name, ['USING'])
+        return _to_native(
+                self._interact_value(_USE % _to_bytes(name), _USING))
 
     def watching(self):
         """Return a list of all tubes being watched."""
-        return self._interact_yaml('list-tubes-watched\r\n', ['OK'])
+        return self._interact_yaml(b'list-tubes-watched\r\n', _OK,
+                                   parse=_parse_yaml_list)
 
     def watch(self, name):
         """Watch a given tube."""
-        return int(self._interact_value('watch %s\r\n' % name, ['WATCHING']))
+        return int(self._interact_value(_WATCH % _to_bytes(name),
+                                        _WATCHING))
 
     def ignore(self, name):
         """Stop watching a given tube."""
         try:
-            return int(self._interact_value('ignore %s\r\n' % name,
-                                            ['WATCHING'],
-                                            ['NOT_IGNORED']))
+            return int(self._interact_value(_IGNORE % _to_bytes(name),
+                                            _WATCHING,
+                                            _NOT_IGNORED))
         except CommandFailed:
             return 1
 
     def stats(self):
         """Return a dict of beanstalkd statistics."""
-        return self._interact_yaml('stats\r\n', ['OK'])
+        return self._interact_yaml(b'stats\r\n', _OK)
 
     def stats_tube(self, name):
         """Return a dict of stats about a given tube."""
-        return self._interact_yaml('stats-tube %s\r\n' % name,
-                                  ['OK'],
-                                  ['NOT_FOUND'])
+        return self._interact_yaml(_STATS_TUBE % _to_bytes(name),
+                                  _OK,
+                                  _NOT_FOUND)
 
     def pause_tube(self, name, delay):
         """Pause a tube for a given delay time, in seconds."""
-        self._interact('pause-tube %s %d\r\n' % (name, delay),
-                       ['PAUSED'],
-                       ['NOT_FOUND'])
+        self._interact(_PAUSE_TUBE % (_to_bytes(name), delay),
+                       _PAUSED,
+                       _NOT_FOUND)
 
     # -- job interactors --
 
     def delete(self, jid):
         """Delete a job, by job id."""
-        self._interact('delete %d\r\n' % jid, ['DELETED'], ['NOT_FOUND'])
+        self._interact(_DELETE % jid, _DELETED, _NOT_FOUND)
+
+    def delete_and_reserve(self, jid, timeout=None):
+        """Delete a job, by job id, and reserve the next one in the same round
+        trip. Takes the same timeout as reserve, and likewise returns a Job
+        object, or None if the reserve times out.
+
+        If the delete fails, its error is raised once any job the reserve
+        picked up has been released. Should the reserve's response not come
+        in cleanly, the connection is closed, as it is out of step with the
+        server."""
+        delete = _DELETE % jid
+        reserve, socket_timeout = self._reserve_command(timeout)
+        self._finish_lookahead()
+        self._sendall(delete + reserve)
+        status, results = self._read_response(self.timeout)
+        try:
+            self._check_response(delete, status, results, _DELETED, _NOT_FOUND)
+        except Beanstalkc2Exception as e:
+            # The reserve is already on its way; don't leave its job behind,
+            # but report the delete's failure whatever happens to the reserve
+            try:
+                job = self._read_reserved(reserve, socket_timeout)
+                if job is not None:
+                    job.release()
+            except DeadlineSoon:
+                pass
+            except (Beanstalkc2Exception, socket.error):
+                # The server may still answer the reserve later; don't let
+                # that answer be mistaken for a reply to the next command
+                self._socket.close()
+            raise e
+        return self._read_reserved(reserve, socket_timeout)
 
     def release(self, jid, priority=DEFAULT_PRIORITY, delay=0):
         """Release a reserved job back into the ready queue."""
-        self._interact('release %d %d %d\r\n' % (jid, priority, delay),
-                       ['RELEASED', 'BURIED'],
-                       ['NOT_FOUND'])
+        self._interact(_RELEASE % (jid, priority, delay),
+                       _RELEASED,
+                       _NOT_FOUND)
 
     def bury(self, jid, priority=DEFAULT_PRIORITY):
         """Bury a job, by job id."""
-        self._interact('bury %d %d\r\n' % (jid, priority),
-                       ['BURIED'],
-                       ['NOT_FOUND'])
+        self._interact(_BURY % (jid, priority),
+                       _BURIED,
+                       _NOT_FOUND)
 
     def touch(self, jid):
         """Touch a job, by job id, requesting more time to work on a reserved
         job before it expires."""
-        self._interact('touch %d\r\n' % jid, ['TOUCHED'], ['NOT_FOUND'])
+        self._interact(_TOUCH % jid, _TOUCHED, _NOT_FOUND)
 
     def stats_job(self, jid):
         """Return a dict of stats about a job, by job id."""
-        return self._interact_yaml('stats-job %d\r\n' % jid,
-                                   ['OK'],
-                                   ['NOT_FOUND'])
+        return self._interact_yaml(_STATS_JOB % jid,
+                                   _OK,
+                                   _NOT_FOUND)
+
+
+class Pipeline(object):
+    """Queues up commands for a connection and sends them all at once.
+
+    Used as a context manager, the queued commands are executed when the
+    block exits without an exception; their results are then available, in
+    order, as `results`."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.results = None
+        self._commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+    def _queue(self, command, expected_ok, expected_err=(), parse=None):
+        self._commands.append((command, expected_ok, expected_err, parse))
+
+    def execute(self):
+        """Send all queued commands in one write and return their results.
+        Every response is read even if one of them is an error, in which case
+        the first error is raised afterwards."""
+        commands, self._commands = self._commands, []
+        self.conn._finish_lookahead()
+        self.conn._sendall(b''.join(command for command, _, _, _ in commands))
+        results = []
+        error = None
+        for command, expected_ok, expected_err, parse in commands:
+            status, response = self.conn._read_response(self.conn.timeout)
+            try:
+                response = self.conn._check_response(
+                        command, status, response, expected_ok, expected_err)
+            except Beanstalkc2Exception as e:
+                error = error or e
+                results.append(e)
+            else:
+                results.append(parse(response) if parse else None)
+        self.results = results
+        if error is not None:
+            raise error
+        return results
+
+    # -- public interface --
+
+    def put(self, body, priority=DEFAULT_PRIORITY, delay=0, ttr=DEFAULT_TTR):
+        """Queue a put; its result is the new job's id."""
+        assert isinstance(body, bytes), 'Job body must be a bytes instance'
+        header = _put_header(len(body), priority, delay, ttr)
+        self._queue(header + body + b'\r\n',
+                    _INSERTED, _JOB_TOO_BIG,
+                    lambda results: int(results[0]))
+
+    def kick(self, bound=1):
+        """Queue a kick; its result is the number of jobs kicked."""
+        self._queue(_KICK % bound, _KICKED,
+                    parse=lambda results: int(results[0]))
+
+    def delete(self, jid):
+        """Queue deleting a job, by job id."""
+        self._queue(_DELETE % jid, _DELETED, _NOT_FOUND)
+
+    def release(self, jid, priority=DEFAULT_PRIORITY, delay=0):
+        """Queue releasing a reserved job back into the ready queue."""
+        self._queue(_RELEASE % (jid, priority, delay),
+                    _RELEASED,
+                    _NOT_FOUND)
+
+    def bury(self, jid, priority=DEFAULT_PRIORITY):
+        """Queue burying a job, by job id."""
+        self._queue(_BURY % (jid, priority),
+                    _BURIED,
+                    _NOT_FOUND)
+
+    def touch(self, jid):
+        """Queue touching a reserved job, by job id."""
+        self._queue(_TOUCH % jid, _TOUCHED, _NOT_FOUND)
 
 
 class Job(object):
+    __slots__ = ('conn', 'jid', 'body', 'reserved')
+
     def __init__(self, conn, jid, body, reserved=True):
         self.conn = conn
         self.jid = jid
@@ -304,6 +689,13 @@ class Job(object):
         self.conn.delete(self.jid)
         self.reserved = False
 
+    def delete_and_reserve_next(self, timeout=None):
+        """Delete this job and reserve the next one in the same round trip.
+        Returns a Job object, or None if the reserve times out."""
+        job = self.conn.delete_and_reserve(self.jid, timeout)
+        self.reserved = False
+        return job
+
     def release(self, priority=None, delay=0):
         """Release this job back into the ready queue."""
         if self.reserved: